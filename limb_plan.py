@@ -0,0 +1,342 @@
+import math
+
+'''
+work out names and offsetParentMatrix values for the limb without touching the scene
+
+nothing in here imports maya so plans can be made on worker threads and tested outside maya
+
+'''
+
+# square control curve used for the ik and pole vector controls
+CONTROL_POINTS = ((0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.0, 0.0, -1.0), (-1.0, 0.0, 0.0), (0.0, 0.0, 1.0))
+
+IDENTITY_MATRIX = (1.0, 0.0, 0.0, 0.0,
+                   0.0, 1.0, 0.0, 0.0,
+                   0.0, 0.0, 1.0, 0.0,
+                   0.0, 0.0, 0.0, 1.0)
+
+def plan_fk_joints(snapshot, search, replace):
+    '''
+    Plans a duplicate of the skin joints placed with the offsetParentMatrix
+    Args:
+        snapshot: (list) of dictionaries with name, rotate_order and matrix keys
+        search: (string) search term
+        replace: (string) replace term
+
+    Returns:
+        (list) of dictionaries with name, rotate_order, parent and offset_matrix keys,
+        parent is the index of the parent joint or None
+    '''
+    plans = []
+
+    for i in range(len(snapshot)):
+        parent = None
+        if i > 0:
+            parent = i - 1
+
+        plans.append({'name': snapshot[i]['name'].replace(search, replace),
+                      'rotate_order': snapshot[i]['rotate_order'],
+                      'parent': parent,
+                      'offset_matrix': list(snapshot[i]['matrix'])})
+
+    return plans
+
+def plan_fk_controls(fk_joints, world_matrices, search, replace):
+    '''
+    Plans a chain of fk controls sitting on the fk joints
+    Args:
+        fk_joints: (list) of fk joint names
+        world_matrices: (list) of fk joint world matrices
+        search: (string) search term
+        replace: (string) replace term
+
+    Returns:
+        (list) of dictionaries with name, parent and offset_matrix keys,
+        parent is the index of the parent control or None
+    '''
+    plans = []
+
+    for i in range(len(fk_joints)):
+        # if it's not the first control we need to negate the parent controls worldMatrix
+        parent = None
+        parent_matrix = None
+        if i > 0:
+            parent = i - 1
+            parent_matrix = world_matrices[i-1]
+
+        plans.append({'name': fk_joints[i].replace(search, replace),
+                      'parent': parent,
+                      'offset_matrix': get_offset_matrix(world_matrices[i], parent_matrix)})
+
+    return plans
+
+def plan_ik_control(end_joint, end_pos):
+    '''
+    Plans an IK control in world space at the end joint position
+    Args:
+        end_joint: (string) end joint name
+        end_pos: (list) of x y z values
+
+    Returns:
+        (dictionary) with name, points and offset_matrix keys
+    '''
+    return {'name': get_side_name(end_joint, 'ik_ctrl'),
+            'points': [list(point) for point in CONTROL_POINTS],
+            'offset_matrix': translation_matrix(end_pos)}
+
+def plan_pv_control(end_joint, start_pos, mid_pos, end_pos):
+    '''
+    Plans a pole vector control
+    Args:
+        end_joint: (string) end joint name
+        start_pos: (list) of x y z values
+        mid_pos: (list) of x y z values
+        end_pos: (list) of x y z values
+
+    Returns:
+        (dictionary) with name, points and offset_matrix keys
+    '''
+    pole_vector_pos = get_pole_vector_position(start_pos, mid_pos, end_pos)
+
+    return {'name': get_side_name(end_joint, 'pv_ctrl'),
+            'points': [list(point) for point in CONTROL_POINTS],
+            'offset_matrix': translation_matrix(pole_vector_pos)}
+
+def plan_limb(snapshot, joint_search, joint_replace, control_search, control_replace,
+              start_joint, mid_joint, end_joint):
+    '''
+    Plans the whole limb from a snapshot of the skin joints
+    Args:
+        snapshot: (list) of dictionaries with name, rotate_order, matrix and position keys
+        joint_search: (string) search term for the fk joints
+        joint_replace: (string) replace term for the fk joints
+        control_search: (string) search term for the fk controls
+        control_replace: (string) replace term for the fk controls
+        start_joint: (string) name of the start joint in the snapshot
+        mid_joint: (string) name of the mid joint in the snapshot
+        end_joint: (string) name of the end joint in the snapshot
+
+    Returns:
+        (dictionary) with fk_joints, fk_controls, ik_control and pv_control keys
+    '''
+    positions = {}
+    for joint in snapshot:
+        positions[joint['name']] = joint['position']
+
+    for joint in [start_joint, mid_joint, end_joint]:
+        if joint not in positions:
+            raise ValueError('{} is not in the snapshot'.format(joint))
+
+    fk_joints = plan_fk_joints(snapshot, joint_search, joint_replace)
+
+    # the fk root has no parent so each world matrix is the local matrices multiplied down the chain
+    world_matrices = []
+    for i in range(len(fk_joints)):
+        world_matrix = fk_joints[i]['offset_matrix']
+        if i > 0:
+            world_matrix = multiply_matrices(world_matrix, world_matrices[i-1])
+        world_matrices.append(world_matrix)
+
+    fk_controls = plan_fk_controls([joint['name'] for joint in fk_joints], world_matrices,
+                                   control_search, control_replace)
+
+    return {'fk_joints': fk_joints,
+            'fk_controls': fk_controls,
+            'ik_control': plan_ik_control(end_joint, positions[end_joint]),
+            'pv_control': plan_pv_control(end_joint, positions[start_joint], positions[mid_joint],
+                                          positions[end_joint])}
+
+def get_side_name(joint, suffix):
+    '''
+    Generates a control name based off the side of the joint
+    Args:
+        joint: (string) joint name
+        suffix: (string) name without the side prefix, e.g. 'ik_ctrl'
+
+    Returns:
+        (string) control name
+
+    '''
+    side = 'C'
+    if 'L_' in joint:
+        side = 'L'
+    if 'R_' in joint:
+        side = 'R'
+
+    return '{}_{}'.format(side, suffix)
+
+def get_pole_vector_position(start_pos, mid_pos, end_pos):
+    '''
+    Projects the mid position away from the start to end line to place a pole vector
+    Args:
+        start_pos: (list) of x y z values
+        mid_pos: (list) of x y z values
+        end_pos: (list) of x y z values
+
+    Returns:
+        (list) of x y z values
+
+    '''
+    start_to_end = subtract_vectors(end_pos, start_pos)
+    scaled = scale_vector(start_to_end, 0.5)
+
+    half_way = add_vectors(scaled, start_pos)
+
+    subtract_half_way = subtract_vectors(mid_pos, half_way)
+
+    length = math.sqrt(sum([value * value for value in subtract_half_way]))
+
+    if length < 5:
+        multiplier = 5.0/length
+        subtract_half_way = scale_vector(subtract_half_way, multiplier)
+
+    return add_vectors(subtract_half_way, mid_pos)
+
+def get_offset_matrix(world_matrix, parent_matrix=None):
+    '''
+    Works out the offsetParentMatrix that places a transform at the world matrix
+    Args:
+        world_matrix: (list) of 16 values
+        parent_matrix: (list) of 16 values, world matrix of the parent or None
+
+    Returns:
+        (list) of 16 values
+
+    '''
+    if parent_matrix is None:
+        return list(world_matrix)
+
+    return multiply_matrices(world_matrix, inverse_matrix(parent_matrix))
+
+def add_vectors(vectorA, vectorB):
+    '''
+    Adds two vectors together
+    Args:
+        vectorA: (list) of x y z values
+        vectorB: (list) of x y z values
+
+    Returns:
+        (list) of x y z values
+
+    '''
+    result = []
+
+    for i in range(len(vectorA)):
+        value = vectorA[i] + vectorB[i]
+        result.append(value)
+
+    return result
+
+
+def subtract_vectors(vectorA, vectorB):
+    '''
+    Subtacts one vector from another
+    Args:
+        vectorA: (list) of x y z values
+        vectorB: (list) of x y z values
+
+    Returns:
+        (list) of x y z values
+
+    '''
+    result = []
+
+    for i in range(len(vectorA)):
+        value = vectorA[i] - vectorB[i]
+        result.append(value)
+
+    return result
+
+def scale_vector(vector, scale_factor):
+    '''
+    Scales a vector by the scale factor
+    Args:
+        vector: (list) of x y z values
+        scale_factor: (float) value to scale by
+
+    Returns:
+        (list) of x y z values
+    '''
+    result = []
+
+    for i in range(len(vector)):
+        value = vector[i] * scale_factor
+        result.append(value)
+
+    return result
+
+def multiply_matrices(matrixA, matrixB):
+    '''
+    Multiplies two matrices together, in the same order as a multMatrix node
+    Args:
+        matrixA: (list) of 16 values
+        matrixB: (list) of 16 values
+
+    Returns:
+        (list) of 16 values
+
+    '''
+    result = []
+
+    for row in range(4):
+        for column in range(4):
+            value = 0.0
+            for i in range(4):
+                value += matrixA[row * 4 + i] * matrixB[i * 4 + column]
+            result.append(value)
+
+    return result
+
+def inverse_matrix(matrix):
+    '''
+    Inverts a matrix using Gauss-Jordan elimination
+    Args:
+        matrix: (list) of 16 values
+
+    Returns:
+        (list) of 16 values
+
+    '''
+    # build rows of the matrix with the identity matrix next to them
+    rows = []
+    for row in range(4):
+        rows.append([float(value) for value in matrix[row * 4:row * 4 + 4]] +
+                    list(IDENTITY_MATRIX[row * 4:row * 4 + 4]))
+
+    for column in range(4):
+        # swap in the row with the largest value to keep things stable
+        pivot = max(range(column, 4), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            raise ValueError('Matrix cannot be inverted')
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+
+        # normalize the pivot row
+        pivot_value = rows[column][column]
+        rows[column] = [value / pivot_value for value in rows[column]]
+
+        # clear the column from every other row
+        for row in range(4):
+            if row != column:
+                factor = rows[row][column]
+                rows[row] = [value - factor * pivot_row_value for value, pivot_row_value in zip(rows[row], rows[column])]
+
+    result = []
+    for row in rows:
+        result.extend(row[4:])
+
+    return result
+
+def translation_matrix(position):
+    '''
+    Creates a matrix that only holds a translation
+    Args:
+        position: (list) of x y z values
+
+    Returns:
+        (list) of 16 values
+
+    '''
+    result = list(IDENTITY_MATRIX)
+    result[12:15] = [position[0], position[1], position[2]]
+
+    return result
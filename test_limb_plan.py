@@ -0,0 +1,68 @@
+import math
+
+import pytest
+
+from limb_plan import (plan_limb, multiply_matrices, inverse_matrix, translation_matrix, IDENTITY_MATRIX,
+                       CONTROL_POINTS)
+
+
+def rotate_z_matrix(angle, position):
+    cos = math.cos(angle)
+    sin = math.sin(angle)
+    return [cos, sin, 0.0, 0.0,
+            -sin, cos, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            position[0], position[1], position[2], 1.0]
+
+
+def assert_matrix_equal(matrixA, matrixB):
+    assert list(matrixA) == pytest.approx(list(matrixB), abs=1e-9)
+
+
+@pytest.fixture
+def snapshot():
+    return [{'name': 'L_shoulder_jnt', 'rotate_order': 'xyz', 'matrix': rotate_z_matrix(0.3, [1.0, 2.0, 3.0]),
+             'position': [0.0, 0.0, 0.0]},
+            {'name': 'L_elbow_jnt', 'rotate_order': 'yzx', 'matrix': rotate_z_matrix(0.5, [4.0, 0.0, 0.0]),
+             'position': [4.0, 0.0, -1.0]},
+            {'name': 'L_wrist_jnt', 'rotate_order': 'xyz', 'matrix': rotate_z_matrix(-0.2, [4.0, 0.0, 0.0]),
+             'position': [8.0, 0.0, 0.0]},
+            {'name': 'L_hand_jnt', 'rotate_order': 'xyz', 'matrix': rotate_z_matrix(0.0, [1.0, 0.0, 0.0]),
+             'position': [9.0, 0.0, 0.0]}]
+
+
+def test_inverse_matrix():
+    matrix = rotate_z_matrix(0.7, [3.0, 4.0, 5.0])
+    assert_matrix_equal(multiply_matrices(matrix, inverse_matrix(matrix)), IDENTITY_MATRIX)
+
+
+def test_plan_limb(snapshot):
+    plan = plan_limb(snapshot, '_jnt', '_fk_jnt', '_jnt', '_ctrl', 'L_shoulder_jnt', 'L_elbow_jnt', 'L_wrist_jnt')
+
+    fk_joints = plan['fk_joints']
+    assert [joint['name'] for joint in fk_joints] == ['L_shoulder_fk_jnt', 'L_elbow_fk_jnt', 'L_wrist_fk_jnt',
+                                                      'L_hand_fk_jnt']
+    assert [joint['parent'] for joint in fk_joints] == [None, 0, 1, 2]
+    assert fk_joints[1]['rotate_order'] == 'yzx'
+
+    # the controls sit on the fk joints so their offsets match the skin joints local matrices
+    fk_controls = plan['fk_controls']
+    assert [control['name'] for control in fk_controls] == ['L_shoulder_fk_ctrl', 'L_elbow_fk_ctrl',
+                                                            'L_wrist_fk_ctrl', 'L_hand_fk_ctrl']
+    assert [control['parent'] for control in fk_controls] == [None, 0, 1, 2]
+    for control, joint in zip(fk_controls, snapshot):
+        assert_matrix_equal(control['offset_matrix'], joint['matrix'])
+
+    assert plan['ik_control']['name'] == 'L_ik_ctrl'
+    assert_matrix_equal(plan['ik_control']['offset_matrix'], translation_matrix([8.0, 0.0, 0.0]))
+
+    # mid joint is only 1 unit off the line so it gets pushed out to 5 units
+    assert plan['pv_control']['name'] == 'L_pv_ctrl'
+    assert_matrix_equal(plan['pv_control']['offset_matrix'], translation_matrix([4.0, 0.0, -6.0]))
+    assert plan['pv_control']['points'] == [list(point) for point in CONTROL_POINTS]
+    assert plan['pv_control']['points'] is not plan['ik_control']['points']
+
+
+def test_plan_limb_missing_joint(snapshot):
+    with pytest.raises(ValueError):
+        plan_limb(snapshot, '_jnt', '_fk_jnt', '_jnt', '_ctrl', 'L_shoulder_jnt', 'L_knee_jnt', 'L_wrist_jnt')
@@ -1,12 +1,17 @@
+from multiprocessing.pool import ThreadPool
+
 import maya.cmds as cmds
 
-import maya.mel as mel
+from limb_plan import (plan_fk_joints, plan_fk_controls, plan_ik_control, plan_pv_control, plan_limb,
+                       get_offset_matrix, add_vectors, subtract_vectors, scale_vector)
 
 '''
 duplicate skin joints and place with offsetParentMatrix to create our fk chain
 
 create fk chain of controls and drive joints
 
+all the placement math lives in limb_plan, the functions here query the scene and apply plans
+
 '''
 
 def duplicate_joints(skin_joints, search, replace):
@@ -20,29 +25,9 @@ def duplicate_joints(skin_joints, search, replace):
     Returns:
         (list) of new joints
     '''
+    plans = plan_fk_joints(snapshot_skeleton(skin_joints), search, replace)
 
-    new_joints = []
-
-    for i in range(len(skin_joints)):
-
-        # create new joints
-        new_joint = cmds.createNode('joint', n=skin_joints[i].replace(search, replace))
-        new_joints.append( new_joint )
-
-        # get and set rotate order
-        rotate_order = cmds.xform(skin_joints[i], q=True, roo=True)
-        cmds.xform(new_joint, roo=rotate_order)
-
-        # parent joints in hierarchy
-        if i > 0:
-            cmds.parent(new_joint, new_joints[i-1])
-
-    # place using offset parent matrix
-    for i in range(len(skin_joints)):
-        cmds.connectAttr('{}.xformMatrix'.format(skin_joints[i]), '{}.offsetParentMatrix'.format(new_joints[i]))
-        cmds.disconnectAttr('{}.xformMatrix'.format(skin_joints[i]), '{}.offsetParentMatrix'.format(new_joints[i]))
-
-    return new_joints
+    return apply_fk_joints(plans)
 
 def create_fk_controls(fk_joints, search, replace):
     '''
@@ -55,38 +40,10 @@ def create_fk_controls(fk_joints, search, replace):
     Returns:
         (list) of controls
     '''
-    controls = []
-
-    for i in range(len(fk_joints)):
-        # create control
-        control = cmds.circle(ch=False, n=fk_joints[i].replace(search, replace))[0]
-        controls.append(control)
+    world_matrices = [cmds.getAttr('{}.worldMatrix[0]'.format(joint)) for joint in fk_joints]
+    plans = plan_fk_controls(fk_joints, world_matrices, search, replace)
 
-        # parent the controls together
-        if i > 0:
-            cmds.parent(control, controls[i-1])
-
-    # place using offset parent matrix
-    for i in range(len(fk_joints)):
-        # if it's not the first joint then we need to use a mult matrix node to negate the controls parents worldMatrix
-        if i > 0:
-            mult = cmds.createNode('multMatrix')
-            cmds.connectAttr('{}.worldMatrix[0]'.format(fk_joints[i]), '{}.matrixIn[0]'.format(mult))
-            cmds.connectAttr('{}.worldInverseMatrix[0]'.format(controls[i-1]), '{}.matrixIn[1]'.format(mult))
-            cmds.connectAttr('{}.matrixSum'.format(mult), '{}.offsetParentMatrix'.format(controls[i]))
-
-            cmds.disconnectAttr('{}.matrixSum'.format(mult), '{}.offsetParentMatrix'.format(controls[i]))
-            cmds.delete(mult)
-        # if it's the first control we can just use the worldMatrix
-        else:
-            cmds.connectAttr('{}.worldMatrix[0]'.format(fk_joints[i]), '{}.offsetParentMatrix'.format(controls[i]))
-            cmds.disconnectAttr('{}.worldMatrix[0]'.format(fk_joints[i]), '{}.offsetParentMatrix'.format(controls[i]))
-
-    # drive the fk joints
-    for i in range(len(controls)):
-        connect_trs(controls[i], fk_joints[i])
-
-    return controls
+    return apply_fk_controls(plans, fk_joints)
 
 def create_ik_control(end_joint):
     '''
@@ -98,29 +55,9 @@ def create_ik_control(end_joint):
         (string) ik control name
 
     '''
-    # generate name based off end joint side
-    ik_control = 'C_ik_ctrl'
-    if 'L_' in end_joint:
-        ik_control = 'L_ik_ctrl'
-    if 'R_' in end_joint:
-        ik_control = 'R_ik_ctrl'
-
-    # create control curve
-    point_one = [0.0, 0.0, 1.0]
-    point_two = [1.0, 0.0, 0.0]
-    point_three = [0.0, 0.0, -1.0]
-    point_four = [-1.0, 0.0, 0.0]
-    point_five = [0.0, 0.0, 1.0]
-
-    cmds.curve(p = [point_one, point_two, point_three, point_four, point_five], n=ik_control, d=1)
-
-    # place control curve
-    cmds.matchTransform(ik_control, end_joint, pos=True, rot=False, scl=False)
-
-    # bake trs to offsetParentMatrix
-    bake_trs_offsetParentMatrix(ik_control)
+    end_pos = cmds.xform(end_joint, q=True, ws=True, rp=True)
 
-    return ik_control
+    return apply_control_curve(plan_ik_control(end_joint, end_pos))
 
 def create_pv_control(start_joint, mid_joint, end_joint):
     '''
@@ -131,50 +68,14 @@ def create_pv_control(start_joint, mid_joint, end_joint):
         end_joint:  (string) name of end joint
 
     Returns:
+        (string) pv control name
 
     '''
-    # generate name based off end joint side
-    pv_control = 'C_pv_ctrl'
-    if 'L_' in end_joint:
-        pv_control = 'L_pv_ctrl'
-    if 'R_' in end_joint:
-        pv_control = 'R_pv_ctrl'
-
-    # create control curve
-    point_one = [0.0, 0.0, 1.0]
-    point_two = [1.0, 0.0, 0.0]
-    point_three = [0.0, 0.0, -1.0]
-    point_four = [-1.0, 0.0, 0.0]
-    point_five = [0.0, 0.0, 1.0]
-
-    cmds.curve(p=[point_one, point_two, point_three, point_four, point_five], n=pv_control, d=1)
-
     start_pos = cmds.xform(start_joint, q=True, ws=True, rp=True)
     mid_pos = cmds.xform(mid_joint, q=True, ws=True, rp=True)
     end_pos = cmds.xform(end_joint, q=True, ws=True, rp=True)
 
-    start_to_end = subtract_vectors(end_pos, start_pos)
-    scaled = scale_vector(start_to_end, 0.5)
-
-    half_way = add_vectors(scaled, start_pos)
-
-    subtract_half_way = subtract_vectors(mid_pos, half_way)
-
-    length = mel.eval('mag <<{}, {}, {}>>;'.format(subtract_half_way[0], subtract_half_way[1], subtract_half_way[2]))
-
-    if length < 5:
-        multiplier = 5/length
-        subtract_half_way = scale_vector(subtract_half_way, multiplier)
-
-    pole_vector_pos = add_vectors(subtract_half_way, mid_pos)
-
-    cmds.xform(pv_control, t=pole_vector_pos, ws=True)
-
-    bake_trs_offsetParentMatrix(pv_control)
-
-    return pv_control
-
-
+    return apply_control_curve(plan_pv_control(end_joint, start_pos, mid_pos, end_pos))
 
 
 def pole_vector_connection(start_joint, pv_control, ik_handle):
@@ -212,113 +113,184 @@ def pole_vector_connection(start_joint, pv_control, ik_handle):
     cmds.connectAttr('{}.output3D'.format(plus_node), '{}.poleVector'.format(ik_handle))
 
 
-
-
-
-def add_vectors(vectorA, vectorB):
+def bake_trs_offsetParentMatrix(transform):
     '''
-    Adds two vectors together
+    Bakes TRS values into the offsetParentMatrix
     Args:
-        vectorA: (list) of x y z values
-        vectorB: (list) of x y z values
+        transform: (string) name of the transform
 
     Returns:
-        (list) of x y z values
 
     '''
-    result = []
+    world_matrix = cmds.getAttr('{}.worldMatrix[0]'.format(transform))
 
-    for i in range(len(vectorA)):
-        value = vectorA[i] + vectorB[i]
-        result.append(value)
+    # check for parent
+    parent_matrix = None
+    parent = cmds.listRelatives(transform, p=True)
+    if parent:
+        parent_matrix = cmds.getAttr('{}.worldMatrix[0]'.format(parent[0]))
 
-    return result
+    # zero out trs values on the transform
+    for attr in ['translate', 'rotate', 'scale']:
+        for axis in 'XYZ':
+            if attr == 'scale':
+                cmds.setAttr('{}.{}{}'.format(transform, attr, axis), 1.0)
+            else:
+                cmds.setAttr('{}.{}{}'.format(transform, attr, axis), 0.0)
 
+    # place with offsetParentMatrix
+    cmds.setAttr('{}.offsetParentMatrix'.format(transform), get_offset_matrix(world_matrix, parent_matrix),
+                 type='matrix')
 
-def subtract_vectors(vectorA, vectorB):
+'''
+two phase build
+
+snapshot the skin joints on the main thread, work out an edit plan for each limb on a
+thread pool with limb_plan, then apply the plans back on the main thread
+
+'''
+
+def snapshot_skeleton(skin_joints):
     '''
-    Subtacts one vector from another
+    Queries everything the limb plan needs from the skin joints
     Args:
-        vectorA: (list) of x y z values
-        vectorB: (list) of x y z values
+        skin_joints: (list) of skin joint names
 
     Returns:
-        (list) of x y z values
-
+        (list) of dictionaries with name, rotate_order, matrix and position keys
     '''
-    result = []
+    snapshot = []
 
-    for i in range(len(vectorA)):
-        value = vectorA[i] - vectorB[i]
-        result.append(value)
+    for joint in skin_joints:
+        snapshot.append({'name': joint,
+                         'rotate_order': cmds.xform(joint, q=True, roo=True),
+                         'matrix': cmds.getAttr('{}.xformMatrix'.format(joint)),
+                         'position': cmds.xform(joint, q=True, ws=True, rp=True)})
 
-    return result
+    return snapshot
 
-def scale_vector(vector, scale_factor):
+def apply_fk_joints(plans):
     '''
-    Scales a vector by the scale factor
+    Creates the fk joints from plan_fk_joints
     Args:
-        vector: (list) of x y z values
-        scale_factor: (float) value to scale by
+        plans: (list) from plan_fk_joints
 
     Returns:
-        (list) of x y z values
+        (list) of new joints
     '''
-    result = []
+    new_joints = []
 
-    for i in range(len(vector)):
-        value = vector[i] * scale_factor
-        result.append(value)
+    for plan in plans:
+        new_joint = cmds.createNode('joint', n=plan['name'])
+        new_joints.append(new_joint)
 
-    return result
+        cmds.xform(new_joint, roo=plan['rotate_order'])
 
-def bake_trs_offsetParentMatrix(transform):
+    # parent joints in hierarchy while everything is still at the origin
+    for i in range(len(plans)):
+        if plans[i]['parent'] is not None:
+            cmds.parent(new_joints[i], new_joints[plans[i]['parent']])
+
+    # place using offset parent matrix
+    for i in range(len(plans)):
+        cmds.setAttr('{}.offsetParentMatrix'.format(new_joints[i]), plans[i]['offset_matrix'], type='matrix')
+
+    return new_joints
+
+def apply_fk_controls(plans, fk_joints):
     '''
-    Bakes TRS values into the offsetParentMatrix
+    Creates the fk controls from plan_fk_controls and drives the fk joints
     Args:
-        transform: (string) name of the transform
+        plans: (list) from plan_fk_controls
+        fk_joints: (list) of fk joint names, in the same order as the plans
 
     Returns:
+        (list) of controls
+    '''
+    controls = []
+
+    for plan in plans:
+        control = cmds.circle(ch=False, n=plan['name'])[0]
+        controls.append(control)
+
+    # parent the controls together while everything is still at the origin
+    for i in range(len(plans)):
+        if plans[i]['parent'] is not None:
+            cmds.parent(controls[i], controls[plans[i]['parent']])
+
+    # place using offset parent matrix
+    for i in range(len(plans)):
+        cmds.setAttr('{}.offsetParentMatrix'.format(controls[i]), plans[i]['offset_matrix'], type='matrix')
+
+    # drive the fk joints
+    for i in range(len(controls)):
+        connect_trs(controls[i], fk_joints[i])
+
+    return controls
 
+def apply_control_curve(plan):
     '''
-    # duplicate transform to place with offsetParentMatrix
-    temp = cmds.duplicate(transform, po=True)[0]
+    Creates a control curve from plan_ik_control or plan_pv_control
+    Args:
+        plan: (dictionary) with name, points and offset_matrix keys
 
-    # check for parent
-    parent = None
-    try:
-        parent = cmds.listRelatives(transform, p=True)[0]
-    except:
-        pass
+    Returns:
+        (string) control name
+    '''
+    control = cmds.curve(p=plan['points'], n=plan['name'], d=1)
+    cmds.setAttr('{}.offsetParentMatrix'.format(control), plan['offset_matrix'], type='matrix')
 
-    # zero out trs values on the transform
-    for attr in ['translate', 'rotate', 'scale']:
-        for axis in 'XYZ':
-            if attr == 'scale':
-                cmds.setAttr('{}.{}{}'.format(transform, attr, axis), 1.0)
-            else:
-                cmds.setAttr('{}.{}{}'.format(transform, attr, axis), 0.0)
+    return control
 
-    # place with offsetParentMatrix
-    if parent:
-        mult = cmds.createNode('multMatrix')
-        cmds.connectAttr('{}.worldMatrix[0]'.format(temp), '{}.matrixIn[0]'.format(mult))
-        cmds.connectAttr('{}.worldInverseMatrix[0]'.format(parent), '{}.matrixIn[1]'.format(mult))
-        cmds.connectAttr('{}.matrixSum'.format(mult), '{}.offsetParentMatrix'.format(transform))
+def apply_limb_plan(plan):
+    '''
+    Builds the limb in the scene from a plan made by plan_limb. Must run on the main thread
+    Args:
+        plan: (dictionary) from plan_limb
 
-        cmds.disconnectAttr('{}.matrixSum'.format(mult), '{}.offsetParentMatrix'.format(transform))
-        cmds.delete(mult)
-    # if there is not a parent
-    else:
-        cmds.connectAttr('{}.worldMatrix[0]'.format(temp), '{}.offsetParentMatrix'.format(transform))
-        cmds.disconnectAttr('{}.worldMatrix[0]'.format(temp), '{}.offsetParentMatrix'.format(transform))
+    Returns:
+        (dictionary) with fk_joints, fk_controls, ik_control and pv_control keys holding the created names
+    '''
+    fk_joints = apply_fk_joints(plan['fk_joints'])
 
-    # delete temp transform
-    cmds.delete(temp)
+    return {'fk_joints': fk_joints,
+            'fk_controls': apply_fk_controls(plan['fk_controls'], fk_joints),
+            'ik_control': apply_control_curve(plan['ik_control']),
+            'pv_control': apply_control_curve(plan['pv_control'])}
 
+def build_limbs(limbs, joint_search, joint_replace, control_search, control_replace, processes=None):
+    '''
+    Builds several limbs, planning them on a thread pool while earlier limbs are applied
+    Args:
+        limbs: (list) of (skin_joints, start_joint, mid_joint, end_joint) tuples, one per limb
+        joint_search: (string) search term for the fk joints
+        joint_replace: (string) replace term for the fk joints
+        control_search: (string) search term for the fk controls
+        control_replace: (string) replace term for the fk controls
+        processes: (int) number of worker threads, defaults to the cpu count
+
+    Returns:
+        (list) of dictionaries from apply_limb_plan, one per limb
+    '''
+    # cmds is only safe on the main thread so take every snapshot up front
+    snapshots = [snapshot_skeleton(limb[0]) for limb in limbs]
 
+    results = []
+    pool = ThreadPool(processes)
+    try:
+        plans = []
+        for snapshot, limb in zip(snapshots, limbs):
+            args = (snapshot, joint_search, joint_replace, control_search, control_replace) + tuple(limb[1:])
+            plans.append(pool.apply_async(plan_limb, args))
 
+        # apply each plan as soon as it is ready while the rest keep computing
+        for plan in plans:
+            results.append(apply_limb_plan(plan.get()))
+    finally:
+        pool.close()
+        pool.join()
 
+    return results
 
 def connect_trs(source, destination):
     '''
@@ -335,4 +307,4 @@ def connect_trs(source, destination):
             try:
                 cmds.connectAttr('{}.{}{}'.format(source, attribute, axis), '{}.{}{}'.format(destination, attribute, axis))
             except:
-                print 'Cannot connect {}.{}{} to {}.{}{}'.format(source, attribute, axis, destination, attribute, axis)
+                print('Cannot connect {}.{}{} to {}.{}{}'.format(source, attribute, axis, destination, attribute, axis))